@@ -0,0 +1,20 @@
+import random
+
+
+# Backoff esponenziale con full jitter: l'attesa raddoppia ad ogni errore
+# fino al massimo e torna al valore base dopo un successo
+class Backoff:
+    def __init__(self, base=1, cap=60):
+        self.base = base
+        self.cap = cap
+        self.delay = base
+
+    # Registra un errore e restituisce l'attesa (casuale tra 0 e il ritardo corrente) prima del prossimo tentativo
+    def on_failure(self):
+        sleep = random.uniform(0, self.delay)
+        self.delay = min(self.delay * 2, self.cap)
+        return sleep
+
+    # Tentativo riuscito: si riparte dal ritardo base
+    def on_success(self):
+        self.delay = self.base
@@ -0,0 +1,49 @@
+import time
+
+
+# Circuit breaker: dopo un certo numero di errori consecutivi blocca le chiamate
+# per un intervallo di recupero, poi lascia passare una sola chiamata di prova
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, recovery_time=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    # Indica se la chiamata può essere eseguita
+    def allow(self):
+        if self.state == self.CLOSED:
+            return True
+
+        # Trascorso l'intervallo di recupero si prova una chiamata
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_time:
+            self.state = self.HALF_OPEN
+            return True
+
+        return False
+
+    # Chiamata riuscita: il circuito torna chiuso
+    def on_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    # Chiamata interrotta senza un esito dalle API: l'eventuale prova torna disponibile
+    # senza contare un errore (opened_at resta invariato, quindi la prossima chiamata può riprovare)
+    def on_abort(self):
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+
+    # Chiamata fallita: restituisce True se il circuito si è appena aperto
+    def on_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            was_open = self.state == self.OPEN
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            return not was_open
+        return False
@@ -1,18 +1,66 @@
 # Gestione importazioni librerie
 import asyncio
+import logging
+import logging.handlers
+import queue
+
+try:
+    # Event loop basato su libuv, più veloce di quello standard (non disponibile su Windows)
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Gestione importazioni da altre pagine del programma
-from protocols.Opc_Ua import connection_to_server
+from app.protocols.Opc_Ua import connection_to_server
+from app.protocols.http_requests import close_http_client
+
+logger = logging.getLogger(__name__)
+
+
+# Configurazione del logging: i messaggi passano da una coda e vengono scritti
+# da un thread separato, così l'I/O su console non blocca l'event loop
+def setup_logging(level=logging.INFO):
+    log_queue = queue.Queue(-1)
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    # asyncua e httpx sono molto verbosi a livello INFO (httpx registra ogni richiesta)
+    logging.getLogger("asyncua").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    return listener
 
 
 # Funzione Principale
 async def main():
+    # Da Python 3.12 i task partono subito fino al primo await, senza attendere un giro dell'event loop
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
     endpoint = "opc.tcp://127.0.0.1:4840/freeopcua/server/"   #Inserire stringa connessione corretta
-    await connection_to_server(endpoint)
+    try:
+        await connection_to_server(endpoint)
+    finally:
+        await close_http_client()
 
 
+# Avvio dalla root del progetto con: python -m app.main
 if __name__ == "__main__":
+    log_listener = setup_logging()
     try:
-        asyncio.run(main())
+        if uvloop is not None:
+            uvloop.run(main())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
-        print("Chiusura in corso...")
\ No newline at end of file
+        logger.info("Chiusura in corso...")
+    finally:
+        # Svuota la coda dei log prima di uscire
+        log_listener.stop()
\ No newline at end of file
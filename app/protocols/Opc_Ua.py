@@ -2,46 +2,151 @@
 from app.config.Node_Id import node_ids
 
 #import da librerie esterne
-from asyncua import Client
+from asyncua import Client, ua
 import asyncio
+import logging
 
+from app.core.backoff import Backoff
 from app.protocols.http_requests import send_data_to_api
 
+logger = logging.getLogger(__name__)
+
+# Attesa (in secondi) prima di reinviare i valori che le API non hanno ricevuto
+RESEND_DELAY = 1
+
+# Intervallo di pubblicazione delle notifiche della sottoscrizione OPC-UA (millisecondi)
+SUBSCRIPTION_PERIOD = 1000
+
+# Attesa iniziale e massima (in secondi) tra i tentativi di riconnessione al server OPC-UA
+RECONNECT_BASE_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+
+
+# Valori in attesa di invio alle API: per ogni nodo si conserva solo il più recente,
+# quindi la memoria è limitata al numero di nodi e nessun aggiornamento recente va perso
+class PendingValues:
+    def __init__(self):
+        self.values = {}
+        self.available = asyncio.Event()
+
+    def put(self, key, value):
+        self.values[key] = value
+        self.available.set()
+
+    # Attende almeno un valore e restituisce tutti quelli in attesa, svuotando l'elenco
+    async def take_all(self):
+        await self.available.wait()
+        self.available.clear()
+        values, self.values = self.values, {}
+        return values
+
+    # Rimette in attesa un valore non inviato, a meno che nel frattempo non ne sia arrivato uno più recente
+    def put_back(self, key, value):
+        if key not in self.values:
+            self.put(key, value)
+
+
+# Riceve dal server OPC-UA le notifiche di cambio valore dei nodi sottoscritti
+class SubscriptionHandler:
+    def __init__(self, node_keys, pending):
+        # Mappa NodeId -> nome del nodo
+        self.node_keys = node_keys
+        self.pending = pending
+
+    def datachange_notification(self, node, val, data):
+        key = self.node_keys[node.nodeid]
+
+        # Un errore su un nodo non blocca le notifiche degli altri
+        status = data.monitored_item.Value.StatusCode
+        if not status.is_good():
+            logger.error("Errore durante la lettura del nodo '%s': %s", key, status.name)
+            return
+
+        logger.debug("Valore aggiornato del nodo '%s': %s", key, val)
+
+        # Invio dei dati al Front-End tramite API
+        self.pending.put(key, val)
+
+    # Cambio di stato della sottoscrizione (es. sessione scaduta): la riconnessione è gestita da connection_to_server
+    def status_change_notification(self, status):
+        logger.warning("Stato della sottoscrizione OPC-UA cambiato: %s", status.Status.name)
+
+
+# Task che invia al Front-End i valori notificati dalla sottoscrizione
+async def api_sender(pending_values):
+    deferred = False
+
+    while True:
+        # Per ogni nodo si invia solo il valore più recente tra quelli notificati dall'ultimo invio
+        pending = await pending_values.take_all()
+
+        # Invii in parallelo sul pool di connessioni: un errore su un nodo non annulla gli altri
+        results = await asyncio.gather(
+            *(send_data_to_api(key, value) for key, value in pending.items()), return_exceptions=True
+        )
+        failed = 0
+        for key, result in zip(pending, results):
+            if isinstance(result, Exception):
+                logger.error("Errore durante l'invio del nodo '%s'", key, exc_info=result)
+            elif result is False:
+                # Valore non ricevuto dalle API: verrà reinviato al prossimo giro
+                pending_values.put_back(key, pending[key])
+                failed += 1
+
+        if failed:
+            if not deferred:
+                logger.warning("API non disponibili: %s valori in attesa di reinvio", failed)
+                deferred = True
+            await asyncio.sleep(RESEND_DELAY)
+        elif deferred:
+            logger.info("Invii alle API ripristinati, valori in attesa reinviati")
+            deferred = False
+
 
 # Funzione di connessione al server OPC-UA
 async def connection_to_server(connection_url):
-    previous_values = {key: None for key in node_ids}
+    # Gli invii alle API avvengono in un task separato, così le notifiche non attendono le risposte HTTP
+    pending_values = PendingValues()
+    sender_task = asyncio.create_task(api_sender(pending_values))
 
-    try:
-        async with Client(url=connection_url) as client:
-            print("Connesso al server OPC-UA")
+    reconnect_backoff = Backoff(RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY)
 
-            # Ottieni i nodi
-            nodes = {key: client.get_node(node_id) for key, node_id in node_ids.items()}
+    try:
+        while True:
+            try:
+                async with Client(url=connection_url) as client:
+                    logger.info("Connesso al server OPC-UA")
+                    reconnect_backoff.on_success()
 
-            while True:
-                for key, node in nodes.items():
-                    try:
-                        # Leggi il valore del nodo
-                        value = await node.read_value()
+                    # Ottieni i nodi
+                    nodes = {key: client.get_node(node_id) for key, node_id in node_ids.items()}
+                    handler = SubscriptionHandler({node.nodeid: key for key, node in nodes.items()}, pending_values)
 
-                        # Stampa solo se il valore è cambiato
-                        if value != previous_values[key]:
-                            print(f"Valore aggiornato del nodo '{key}': {value}")
-                            previous_values[key] = value
+                    # Sottoscrizione ai cambi di valore: il server invia solo i nodi cambiati, senza rileggerli ad ogni ciclo
+                    subscription = await client.create_subscription(SUBSCRIPTION_PERIOD, handler)
+                    handles = await subscription.subscribe_data_change(list(nodes.values()))
+                    for key, handle in zip(nodes, handles):
+                        if isinstance(handle, ua.StatusCode):
+                            logger.error("Impossibile sottoscrivere il nodo '%s': %s", key, handle.name)
 
-                            # Invio dei dati al Front-End tramite API
-                            await send_data_to_api(key, value)
+                    # Controlla periodicamente la connessione: se è caduta solleva l'eccezione e si passa alla riconnessione
+                    while True:
+                        await asyncio.sleep(1)
+                        await client.check_connection()
 
-                    except Exception as e:
-                        print(f"Errore durante la lettura del nodo '{key}': {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Errore di connessione al server OPC-UA: %r", e)
 
-                # Attende 1 secondo prima di rileggere
-                await asyncio.sleep(1)
+            # Backoff esponenziale con full jitter: più client non si riconnettono tutti nello stesso istante
+            delay = reconnect_backoff.on_failure()
+            logger.info("Nuovo tentativo di connessione tra %.1f secondi", delay)
+            await asyncio.sleep(delay)
 
     except asyncio.CancelledError:
-        print("Esecuzione interrotta dall'utente.")
-    except Exception as e:
-        print(f"Errore generico: {e}")
+        logger.info("Esecuzione interrotta dall'utente.")
     finally:
-        print("Programma terminato.")
+        sender_task.cancel()
+        await asyncio.gather(sender_task, return_exceptions=True)
+        logger.info("Programma terminato.")
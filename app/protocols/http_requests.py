@@ -1,4 +1,13 @@
-import requests
+import asyncio
+import json
+import logging
+
+import httpx
+
+from app.core.backoff import Backoff
+from app.core.circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
 
 # Base URL dell'API
 API_BASE_URL = "http://localhost:8000/api/v1"
@@ -30,28 +39,100 @@ NODE_ENDPOINT_MAP = {
     "coolant_temperature": "/metrics/coolant/temperature",
 }
 
-# Funzione per l'invio dei dati al corretto endpoint API in base al nodo OPC-UA
-async def send_data_to_api(node_name, value):
-    # Verifico se il nodo è mappato ad un endpoint
-    if node_name not in NODE_ENDPOINT_MAP:
-        print(f"Nodo '{node_name}' non riconosciuto. Nessun endpoint definito.")
-        return
+# Tentativi di invio per ogni valore e attesa iniziale e massima (in secondi) tra un tentativo e l'altro
+SEND_ATTEMPTS = 3
+SEND_RETRY_BASE_DELAY = 0.1
+SEND_RETRY_MAX_DELAY = 2
+
+# Client HTTP condiviso: mantiene aperte le connessioni verso le API invece di aprirne una per ogni invio
+http_client = httpx.AsyncClient(
+    base_url=API_BASE_URL,
+    timeout=5,
+    limits=httpx.Limits(max_keepalive_connections=32),
+)
+
+# Il payload è serializzato prima dell'invio, quindi il Content-Type va indicato esplicitamente
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Se le API non rispondono si sospendono gli invii per un po', invece di attendere il timeout ad ogni valore
+api_breaker = CircuitBreaker(failure_threshold=5, recovery_time=30)
+
+
+# Registra un errore delle API e avvisa quando gli invii vengono sospesi
+def record_api_failure():
+    if api_breaker.on_failure():
+        logger.warning("API non raggiungibili, invii sospesi per %s secondi", api_breaker.recovery_time)
 
-    # Costruisco l'URL di destinazione
-    url = API_BASE_URL + NODE_ENDPOINT_MAP[node_name]
 
-    # Costruisco il payload
-    payload = {"value": value}
+# Funzione per l'invio dei dati al corretto endpoint API in base al nodo OPC-UA.
+# Restituisce False se le API non sono raggiungibili e il valore va ritentato più tardi
+async def send_data_to_api(node_name, value):
+    # Verifico se il nodo è mappato ad un endpoint (una sola ricerca nel dizionario)
+    endpoint = NODE_ENDPOINT_MAP.get(node_name)
+    if endpoint is None:
+        logger.warning("Nodo '%s' non riconosciuto. Nessun endpoint definito.", node_name)
+        return True
 
+    # Costruisco il payload prima di consultare il circuit breaker: un valore non serializzabile
+    # in JSON (es. un tipo OPC-UA, NaN o infinito) viene scartato senza contattare le API
     try:
-        # Invio dati tramite POST
-        response = requests.post(url, json=payload, timeout=5)
+        payload = json.dumps({"value": value}, allow_nan=False)
+    except (TypeError, ValueError) as e:
+        logger.error("Valore del nodo '%s' non serializzabile in JSON, scartato: %r", node_name, e)
+        return True
+
+    # Circuito aperto: le API sono considerate irraggiungibili, il dato verrà reinviato più tardi
+    if not api_breaker.allow():
+        logger.debug("Circuito aperto, invio a %s rimandato", endpoint)
+        return False
+
+    # Gli errori temporanei (connessione o risposta 5xx) vengono ritentati con attese crescenti
+    retry_backoff = Backoff(SEND_RETRY_BASE_DELAY, SEND_RETRY_MAX_DELAY)
+    server_error = False
 
-        # Verifico la risposta
-        if response.status_code == 200:
-            print(f"Dato inviato a {url}: {payload}")
+    for attempt in range(1, SEND_ATTEMPTS + 1):
+        try:
+            # Invio dati tramite POST (l'URL completo è costruito dal client a partire da API_BASE_URL)
+            response = await http_client.post(endpoint, content=payload, headers=JSON_HEADERS)
+        except httpx.RequestError as e:
+            logger.error("Errore di connessione a %s (tentativo %s/%s): %r", endpoint, attempt, SEND_ATTEMPTS, e)
+            server_error = False
+        except Exception:
+            # Errore imprevisto (locale, non delle API): il valore viene scartato senza contare un errore
+            # nel circuit breaker, ma un'eventuale chiamata di prova va chiusa per non lasciarlo in half-open
+            logger.exception("Errore imprevisto nell'invio a %s, valore scartato", endpoint)
+            api_breaker.on_abort()
+            return True
         else:
-            print(f"Errore nell'invio a {url}: {response.status_code} - {response.text}")
+            # Verifico la risposta
+            if response.status_code == 200:
+                logger.debug("Dato inviato a %s: %s", endpoint, payload)
+            else:
+                logger.error("Errore nell'invio a %s (tentativo %s/%s): %s - %s",
+                             endpoint, attempt, SEND_ATTEMPTS, response.status_code, response.text)
+
+            # Le API hanno risposto, quindi sono raggiungibili: il circuito resta (o torna) chiuso
+            api_breaker.on_success()
+
+            # Solo gli errori 5xx indicano un problema del server: gli altri esiti non si ritentano
+            if response.status_code < 500:
+                return True
+            server_error = True
+
+        if attempt < SEND_ATTEMPTS:
+            await asyncio.sleep(retry_backoff.on_failure())
+
+    # Errore 5xx anche all'ultimo tentativo: il problema riguarda solo questo endpoint,
+    # quindi il valore viene scartato invece di bloccare gli invii degli altri nodi
+    if server_error:
+        logger.error("Invio a %s non riuscito dopo %s tentativi, valore scartato", endpoint, SEND_ATTEMPTS)
+        return True
+
+    # Tutti i tentativi sono falliti per errori di connessione: il valore verrà reinviato più tardi
+    record_api_failure()
+    return False
+
 
-    except requests.RequestException as e:
-        print(f"Errore di connessione a {url}: {e}")
\ No newline at end of file
+# Chiude le connessioni del client HTTP condiviso
+async def close_http_client():
+    await http_client.aclose()
\ No newline at end of file